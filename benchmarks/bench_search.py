@@ -0,0 +1,162 @@
+"""Times `search.search_descriptions` on a full season of plate appearances.
+
+`saberdb` must be importable, so install the package first (`pip install -e .`)
+or run from the repository root with `PYTHONPATH=.`.
+
+Usage:
+    python benchmarks/bench_search.py            # synthetic season
+    python benchmarks/bench_search.py path.db    # existing saberdb database
+"""
+
+import datetime
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+import numpy as np
+import peewee as pw
+
+from saberdb import model
+from saberdb import search
+
+
+GAMES = 2430
+PLATE_APPEARANCES = 75
+MAX_PITCHES = 7
+PLAYERS = 1200
+REPEATS = 10
+SEED = 0
+
+POSITIONS = [
+    "shortstop",
+    "second baseman",
+    "third baseman",
+    "first baseman",
+    "left fielder",
+    "center fielder",
+    "right fielder",
+]
+
+# NOTE: `(query, raw)` pairs; raw queries use FTS5 syntax directly.
+QUERIES = [
+    ("grounds shortstop", False),
+    ("grounds out, shortstop", False),
+    ("Player17 grounds out", False),
+    ("homers", False),
+    ('"Player17 grounds out"', True),
+    ("Player5 AND Player9", True),
+]
+
+
+def _description(rng: np.random.Generator) -> str:
+    batter, fielder, other = rng.choice(PLAYERS, 3)
+    position = rng.choice(POSITIONS)
+    match rng.integers(4):
+        case 0:
+            return (
+                f"Player{batter} grounds out, {position} Player{fielder} to first"
+                f" baseman Player{other}."
+            )
+        case 1:
+            return f"Player{batter} strikes out swinging."
+        case 2:
+            return (
+                f"Player{batter} singles on a line drive to {position} Player{fielder}."
+            )
+        case _:
+            return (
+                f"Player{batter} homers ({rng.integers(1, 50)}) on a fly ball to"
+                " left field."
+            )
+
+
+def build_synthetic(path: Path) -> pw.SqliteDatabase:
+    db = pw.SqliteDatabase(str(path))
+    db.connect()
+    models = model.get_db_models(db)
+    db.create_tables([models.DateCache, models.Game])
+
+    # NOTE: Search only reads these pitch columns, so a reduced `pitch` table
+    # with the same index stands in for the full one, which has many NOT NULL
+    # columns that are irrelevant here.
+    db.execute_sql(
+        """
+        CREATE TABLE "pitch" (
+            "id" INTEGER NOT NULL PRIMARY KEY,
+            "game_id" INTEGER NOT NULL,
+            "at_bat_number" INTEGER NOT NULL,
+            "pitch_number" INTEGER NOT NULL,
+            "des" TEXT NOT NULL
+        )
+        """
+    )
+    db.execute_sql(
+        'CREATE INDEX "pitch_game_id_at_bat_number"'
+        ' ON "pitch" ("game_id", "at_bat_number")'
+    )
+
+    rng = np.random.default_rng(SEED)
+    date = datetime.date(2024, 4, 1)
+    rows = [
+        (game_pk, at_bat_number, pitch_number, des)
+        for game_pk in range(1, GAMES + 1)
+        for at_bat_number in range(1, PLATE_APPEARANCES + 1)
+        for des in [_description(rng)]
+        for pitch_number in range(1, int(rng.integers(1, MAX_PITCHES + 1)) + 1)
+    ]
+    with db.atomic():
+        models.DateCache.create(date=date)
+        models.Game.insert_many(
+            [
+                {
+                    "pk": game_pk,
+                    "date": date,
+                    "game_type": model.GameType.REGULAR_SEASON.value,
+                    "home_team": "HOM",
+                    "away_team": "AWY",
+                }
+                for game_pk in range(1, GAMES + 1)
+            ]
+        ).execute()
+        db.cursor().executemany(
+            'INSERT INTO "pitch" ("game_id", "at_bat_number", "pitch_number", "des")'
+            " VALUES (?, ?, ?, ?)",
+            rows,
+        )
+
+    # NOTE: The index is populated from `pitch` the same way `fill_db` does it
+    # for a new database.
+    start = time.perf_counter()
+    search.create_description_index(db)
+    print(
+        f"indexed {GAMES * PLATE_APPEARANCES} plate appearances from {len(rows)}"
+        f" pitches in {time.perf_counter() - start:.2f}s"
+    )
+    return db
+
+
+def main() -> None:
+    if len(sys.argv) > 1:
+        db = pw.SqliteDatabase(sys.argv[1])
+        db.connect()
+    else:
+        db = build_synthetic(Path(tempfile.mkdtemp()) / "bench.db")
+
+    for query, raw in QUERIES:
+        # NOTE: The first run warms the page cache and is not timed.
+        search.search_descriptions(db, query, raw=raw)
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            matches = search.search_descriptions(db, query, raw=raw)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000 / REPEATS
+        print(
+            f"{query!r:32} raw={raw!s:5} {len(matches):4} matches {elapsed_ms:8.2f}ms"
+        )
+
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
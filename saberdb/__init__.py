@@ -8,5 +8,11 @@
 # TODO(mkcmkc): Add proper linting.
 # TODO(mkcmkc): Generate documentation.
 from . import model as model
+from . import heatmap as heatmap
+from . import arsenal as arsenal
+from . import sidecar as sidecar
+from . import cache as cache
+from . import search as search
+from . import schema as schema
 from .core import fill_db as fill_db
 from .core import download_into_db as download_into_db
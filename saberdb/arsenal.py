@@ -0,0 +1,357 @@
+import dataclasses
+from pathlib import Path
+import typing as ty
+
+import numpy as np
+import pandas as pd
+import peewee as pw
+
+from . import util as U
+from . import model
+from . import cache
+from . import schema
+from .model.pitch import PitchType
+
+
+@dataclasses.dataclass(frozen=True)
+class Feature:
+    name: str
+    center: float
+    scale: float
+
+
+# NOTE: `spin_axis` is split into its sine and cosine so that 359 and 1 degree
+# axes are neighbours. Centers and scales are fixed league-typical values
+# rather than fitted ones so that vectors stay comparable across ingests.
+FEATURES = [
+    Feature("release_speed", 88.0, 5.0),
+    Feature("release_spin_rate", 2300.0, 300.0),
+    Feature("pfx_x", 0.0, 0.5),
+    Feature("pfx_z", 0.7, 0.5),
+    Feature("spin_axis_sin", 0.0, 0.5),
+    Feature("spin_axis_cos", 0.0, 0.5),
+    Feature("arm_angle", 35.0, 10.0),
+]
+FEATURE_NAMES = [feature.name for feature in FEATURES]
+WEIGHT_NAMES = [
+    "release_speed",
+    "release_spin_rate",
+    "pfx_x",
+    "pfx_z",
+    "spin_axis",
+    "arm_angle",
+    "usage",
+]
+PITCH_TYPES = [x.value for x in PitchType]
+SOURCE_COLUMNS = [
+    "pitcher",
+    "game_date",
+    "pitch_type",
+    "release_speed",
+    "release_spin_rate",
+    "pfx_x",
+    "pfx_z",
+    "spin_axis",
+    "arm_angle",
+]
+
+# NOTE: Per pitch type the stats row holds the pitch count followed by the
+# sum and non-null count of every feature.
+STATS_SHAPE = (len(PITCH_TYPES), 1 + 2 * len(FEATURES))
+STATS_DTYPE = np.dtype("<f8")
+VECTOR_SIZE = len(PITCH_TYPES) * (len(FEATURES) + 1)
+
+
+def encode_stats(stats: np.ndarray) -> bytes:
+    assert stats.shape == STATS_SHAPE, U.dbg_info(
+        "Invalid stats shape", shape=list(stats.shape)
+    )
+    return stats.astype(STATS_DTYPE, copy=False).tobytes()
+
+
+def decode_stats(blob: bytes) -> np.ndarray:
+    stats = np.frombuffer(blob, dtype=STATS_DTYPE)
+    assert stats.size == STATS_SHAPE[0] * STATS_SHAPE[1], U.dbg_info(
+        "Invalid stats size", size=stats.size
+    )
+    return stats.reshape(STATS_SHAPE)
+
+
+# NOTE: Stats are only ever added to, so they assume the pitches of a date
+# are filled once. `fill_db` rebuilds the seasons of re-ingested dates, and
+# deleting a date without re-ingesting it needs `rebuild_arsenals`.
+def fill_arsenal_table(
+    db: pw.SqliteDatabase, models: model.DBModels, df: pd.DataFrame
+) -> None:
+    df = df[df["pitch_type"].isin(PITCH_TYPES)]
+    if df.shape[0] == 0:
+        return
+
+    spin_axis = np.deg2rad(df["spin_axis"].astype(float))
+    df = pd.DataFrame(
+        {
+            "pitcher": df["pitcher"].astype(int),
+            "season": df["game_date"].str[:4].astype(int),
+            "pitch_type": df["pitch_type"],
+            "release_speed": df["release_speed"].astype(float),
+            "release_spin_rate": df["release_spin_rate"].astype(float),
+            "pfx_x": df["pfx_x"].astype(float),
+            "pfx_z": df["pfx_z"].astype(float),
+            "spin_axis_sin": np.sin(spin_axis),
+            "spin_axis_cos": np.cos(spin_axis),
+            "arm_angle": df["arm_angle"].astype(float),
+        }
+    )
+    groups = df.groupby(["pitcher", "season", "pitch_type"], sort=False)
+    sums = groups[FEATURE_NAMES].sum()
+    counts = groups[FEATURE_NAMES].count()
+    sizes = groups.size()
+
+    batch: dict[tuple[int, int], np.ndarray] = {}
+    type_index = {x: i for i, x in enumerate(PITCH_TYPES)}
+    for group_key, size in sizes.items():
+        pitcher_id, season, pitch_type = ty.cast(tuple[ty.Any, ...], group_key)
+        key = (int(pitcher_id), int(season))
+        stats = batch.setdefault(key, np.zeros(STATS_SHAPE, dtype=STATS_DTYPE))
+        row = stats[type_index[pitch_type]]
+        row[0] += size
+        row[1::2] += sums.loc[group_key].to_numpy()  # type: ignore
+        row[2::2] += counts.loc[group_key].to_numpy()  # type: ignore
+
+    Arsenal = models.Arsenal
+    with db.atomic():
+        existing: dict[tuple[int, int], model._Arsenal] = {}
+        for season in sorted({season for _, season in batch}):
+            pitcher_ids = sorted({p for p, s in batch if s == season})
+            query = Arsenal.select().where(
+                (Arsenal.season == season) & (Arsenal.pitcher.in_(pitcher_ids))
+            )
+            for record in query:
+                existing[(int(record.pitcher_id), int(record.season))] = record  # type: ignore
+
+        for (pitcher_id, season), stats in batch.items():
+            existing_record = existing.get((pitcher_id, season))
+            if existing_record is None:
+                Arsenal.create(
+                    pitcher=pitcher_id, season=season, stats=encode_stats(stats)
+                )
+            else:
+                existing_record.stats = encode_stats(  # type: ignore
+                    decode_stats(existing_record.stats) + stats  # type: ignore
+                )
+                existing_record.save()
+
+
+def rebuild_arsenals(
+    db: pw.SqliteDatabase,
+    models: model.DBModels,
+    seasons: None | ty.Iterable[int] = None,
+) -> None:
+    Arsenal = models.Arsenal
+    with db.atomic():
+        query = Arsenal.delete()
+        if seasons is not None:
+            seasons = sorted(set(seasons))
+            query = query.where(Arsenal.season.in_(seasons))
+
+        query.execute()
+        df = schema.read_pitch_frame(db, models, SOURCE_COLUMNS, seasons=seasons)
+        fill_arsenal_table(db, models, df)
+
+
+def default_weights() -> dict[str, float]:
+    return {name: 1.0 for name in WEIGHT_NAMES}
+
+
+def validate_weights(weights: dict[str, float]) -> None:
+    unknown = set(weights) - set(WEIGHT_NAMES)
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown feature weights: {sorted(unknown)!s}")
+
+
+def arsenal_vectors(stats: np.ndarray, weights: dict[str, float]) -> np.ndarray:
+    validate_weights(weights)
+    weights = default_weights() | weights
+    feature_weights = np.array(
+        [
+            weights[name.removesuffix("_sin").removesuffix("_cos")]
+            for name in FEATURE_NAMES
+        ]
+    )
+    centers = np.array([feature.center for feature in FEATURES])
+    scales = np.array([feature.scale for feature in FEATURES])
+
+    # NOTE: `stats` is (n, n_types, n_stats). Feature deviations are scaled by
+    # the square root of usage so that rarely thrown pitches contribute little
+    # and unthrown pitch types contribute nothing.
+    sizes = stats[..., 0]
+    totals = sizes.sum(axis=1, keepdims=True)
+    usage = np.divide(sizes, totals, out=np.zeros_like(sizes), where=totals > 0)
+    sums = stats[..., 1::2]
+    counts = stats[..., 2::2]
+    means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+    deviations = np.where(counts > 0, (means - centers) / scales, 0.0)
+    features = deviations * feature_weights * np.sqrt(usage)[..., None]
+    vectors = np.concatenate(
+        [features, (weights["usage"] * usage / 0.1)[..., None]], axis=-1
+    )
+    return vectors.reshape(stats.shape[0], VECTOR_SIZE).astype(np.float32)
+
+
+@dataclasses.dataclass(frozen=True)
+class Neighbor:
+    pitcher_id: int
+    season: int
+    distance: float
+
+
+@dataclasses.dataclass
+class ArsenalIndex:
+    weights: dict[str, float]
+    keys: np.ndarray
+    vectors: np.ndarray
+    seq: int = 0
+    _norms: None | np.ndarray = dataclasses.field(default=None, repr=False)
+
+    @classmethod
+    def build(
+        cls,
+        models: model.DBModels,
+        weights: None | dict[str, float] = None,
+    ) -> "ArsenalIndex":
+        weights = {} if weights is None else weights
+        validate_weights(weights)
+        index = cls(
+            weights=default_weights() | weights,
+            keys=np.zeros((0, 2), dtype=np.int64),
+            vectors=np.zeros((0, VECTOR_SIZE), dtype=np.float32),
+        )
+        index.seq, _ = cache.compute_at_watermark(
+            models, lambda: index._load_seasons(models, None)
+        )
+        return index
+
+    def _load_seasons(self, models: model.DBModels, seasons: None | set[int]) -> None:
+        Arsenal = models.Arsenal
+        query = Arsenal.select()
+        if seasons is not None:
+            query = query.where(Arsenal.season.in_(sorted(seasons)))
+
+        keys: list[tuple[int, int]] = []
+        blobs: list[np.ndarray] = []
+        for record in query.order_by(Arsenal.season, Arsenal.pitcher):
+            keys.append((int(record.pitcher_id), int(record.season)))  # type: ignore
+            blobs.append(decode_stats(record.stats))  # type: ignore
+
+        if seasons is not None:
+            keep = ~np.isin(self.keys[:, 1], sorted(seasons))
+            self.keys = self.keys[keep]
+            self.vectors = self.vectors[keep]
+
+        if len(keys) > 0:
+            self.keys = np.concatenate([self.keys, np.array(keys, dtype=np.int64)])
+            self.vectors = np.concatenate(
+                [self.vectors, arsenal_vectors(np.stack(blobs), self.weights)]
+            )
+
+        self._norms = None
+
+    def update(self, models: model.DBModels) -> None:
+        watermark = cache.get_watermark(models)
+        if watermark.seq == self.seq:
+            return
+
+        seasons = {x.year for x in cache.touched_dates(models, self.seq)}
+        self._load_seasons(models, seasons)
+        self.seq = watermark.seq
+
+    def nearest(
+        self,
+        pitcher_id: int,
+        season: int,
+        k: int = 10,
+        *,
+        seasons: None | ty.Iterable[int] = None,
+    ) -> list[Neighbor]:
+        matches = np.flatnonzero(
+            (self.keys[:, 0] == pitcher_id) & (self.keys[:, 1] == season)
+        )
+        if len(matches) == 0:
+            raise KeyError(f"No arsenal for pitcher {pitcher_id!s} in {season!s}")
+
+        if self._norms is None:
+            self._norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+
+        target = int(matches[0])
+        query = self.vectors[target]
+        distances = self._norms - 2.0 * (self.vectors @ query) + self._norms[target]
+        distances[target] = np.inf
+        if seasons is not None:
+            distances[~np.isin(self.keys[:, 1], list(seasons))] = np.inf
+
+        k = min(k, int(np.isfinite(distances).sum()))
+        if k <= 0:
+            return []
+
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [
+            Neighbor(
+                pitcher_id=int(self.keys[i, 0]),
+                season=int(self.keys[i, 1]),
+                distance=float(np.sqrt(max(distances[i], 0.0))),
+            )
+            for i in top
+        ]
+
+    def save(self, path: Path) -> None:
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                weight_names=np.array(list(self.weights.keys())),
+                weight_values=np.array(list(self.weights.values())),
+                keys=self.keys,
+                vectors=self.vectors,
+                seq=np.array(self.seq),
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "ArsenalIndex":
+        with np.load(path) as data:
+            return cls(
+                weights=dict(
+                    zip(
+                        map(str, data["weight_names"]),
+                        map(float, data["weight_values"]),
+                    )
+                ),
+                keys=data["keys"],
+                vectors=data["vectors"],
+                seq=int(data["seq"]),
+            )
+
+
+# NOTE: `fill_db(..., arsenal_index_path=...)` calls this after every batch
+# with `weights=None`, which keeps the weights stored in the index. Passing
+# different weights rebuilds the index with them.
+def update_index(
+    models: model.DBModels,
+    path: Path,
+    weights: None | dict[str, float] = None,
+) -> ArsenalIndex:
+    if weights is not None:
+        validate_weights(weights)
+
+    index: None | ArsenalIndex = None
+    if path.exists():
+        index = ArsenalIndex.load(path)
+        if weights is not None and index.weights != default_weights() | weights:
+            index = None
+
+    if index is None:
+        index = ArsenalIndex.build(models, weights)
+    else:
+        index.update(models)
+
+    index.save(path)
+    return index
@@ -0,0 +1,257 @@
+from collections import OrderedDict
+from collections.abc import Callable
+import dataclasses
+import datetime
+import enum
+import hashlib
+import json
+import os
+from pathlib import Path
+import pickle
+import typing as ty
+
+import peewee as pw
+
+from . import model
+
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_DISK_BYTES = 256 * 1024 * 1024
+
+T = ty.TypeVar("T")
+
+
+@dataclasses.dataclass(frozen=True)
+class Watermark:
+    seq: int
+    max_date: None | datetime.date
+
+
+def get_watermark(models: model.DBModels) -> Watermark:
+    IngestWatermark = models.IngestWatermark
+    seq, max_date = IngestWatermark.select(
+        pw.fn.MAX(IngestWatermark.id), pw.fn.MAX(IngestWatermark.date)
+    ).scalar(as_tuple=True)
+    if isinstance(max_date, str):
+        max_date = datetime.date.fromisoformat(max_date)
+
+    return Watermark(seq=0 if seq is None else int(seq), max_date=max_date)
+
+
+def compute_at_watermark(
+    models: model.DBModels, compute: Callable[[], T]
+) -> tuple[int, T]:
+    # NOTE: The watermark is read before computing, so an ingest landing while
+    # `compute` runs stays newer than the returned seq and is picked up by the
+    # next refresh instead of being missed.
+    seq = get_watermark(models).seq
+    return seq, compute()
+
+
+def touched_dates(models: model.DBModels, since_seq: int) -> set[datetime.date]:
+    IngestWatermark = models.IngestWatermark
+    dates: set[datetime.date] = set()
+    for record in IngestWatermark.select(IngestWatermark.date).where(
+        IngestWatermark.id > since_seq
+    ):
+        touched_date = record.date
+        assert isinstance(touched_date, datetime.date)
+        dates.add(touched_date)
+
+    return dates
+
+
+def _normalize(value: ty.Any) -> ty.Any:
+    match value:
+        case enum.Enum():
+            return _normalize(value.value)
+        case datetime.date():
+            return value.isoformat()
+        case dict():
+            return {str(k): _normalize(v) for k, v in value.items() if v is not None}
+        case set() | frozenset():
+            return sorted((_normalize(x) for x in value), key=repr)
+        case list() | tuple():
+            return [_normalize(x) for x in value]
+        case _:
+            return value
+
+
+def make_key(
+    name: str,
+    params: dict[str, ty.Any],
+    *,
+    start_date: None | datetime.date = None,
+    end_date: None | datetime.date = None,
+) -> str:
+    # NOTE: `None` parameters are dropped so that omitting a filter and
+    # passing `None` for it share an entry. The date range is part of the key
+    # because it also decides when the entry is invalidated.
+    return json.dumps(
+        {
+            "name": name,
+            "params": _normalize(params),
+            "range": _normalize([start_date, end_date]),
+        },
+        sort_keys=True,
+        default=str,
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class _Entry:
+    seq: int
+    start_date: None | datetime.date
+    end_date: None | datetime.date
+    value: ty.Any
+
+
+class QueryCache:
+    def __init__(
+        self,
+        models: model.DBModels,
+        *,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        disk_path: None | Path = None,
+        max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+    ) -> None:
+        if max_entries < 0:
+            raise ValueError(f"max_entries({max_entries!s}) must be non-negative")
+
+        if max_disk_bytes < 0:
+            raise ValueError(f"max_disk_bytes({max_disk_bytes!s}) must be non-negative")
+
+        self.models = models
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: OrderedDict[str, _Entry] = OrderedDict()
+        if disk_path is not None:
+            disk_path.mkdir(parents=True, exist_ok=True)
+
+    def _is_stale(self, entry: _Entry) -> bool:
+        IngestWatermark = self.models.IngestWatermark
+        condition = IngestWatermark.id > entry.seq
+        if entry.start_date is not None:
+            condition &= IngestWatermark.date >= entry.start_date
+
+        if entry.end_date is not None:
+            condition &= IngestWatermark.date <= entry.end_date
+
+        return IngestWatermark.select().where(condition).exists()
+
+    def _disk_file(self, key: str) -> Path:
+        assert self.disk_path is not None
+        return self.disk_path / (hashlib.sha256(key.encode()).hexdigest() + ".pkl")
+
+    def _get_memory(self, key: str) -> None | _Entry:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+
+        if self._is_stale(entry):
+            del self._memory[key]
+            return None
+
+        self._memory.move_to_end(key)
+        return entry
+
+    def _put_memory(self, key: str, entry: _Entry) -> None:
+        if self.max_entries == 0:
+            return
+
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _get_disk(self, key: str) -> None | _Entry:
+        if self.disk_path is None:
+            return None
+
+        disk_file = self._disk_file(key)
+        try:
+            with open(disk_file, "rb") as f:
+                stored_key, entry = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+        assert isinstance(entry, _Entry)
+        if stored_key != key or self._is_stale(entry):
+            disk_file.unlink(missing_ok=True)
+            return None
+
+        os.utime(disk_file)
+        return entry
+
+    def _put_disk(self, key: str, entry: _Entry) -> None:
+        if self.disk_path is None:
+            return
+
+        data = pickle.dumps((key, entry), protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_disk_bytes:
+            return
+
+        disk_file = self._disk_file(key)
+        tmp_file = disk_file.with_suffix(".tmp")
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+
+        os.replace(tmp_file, disk_file)
+        self._trim_disk()
+
+    def _trim_disk(self) -> None:
+        assert self.disk_path is not None
+        files: list[tuple[float, int, Path]] = []
+        for disk_file in self.disk_path.glob("*.pkl"):
+            try:
+                stat = disk_file.stat()
+            except FileNotFoundError:
+                continue
+
+            files.append((stat.st_mtime, stat.st_size, disk_file))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, disk_file in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+
+            disk_file.unlink(missing_ok=True)
+            total -= size
+
+    def get_or_compute(
+        self,
+        name: str,
+        params: dict[str, ty.Any],
+        compute: Callable[[], T],
+        *,
+        start_date: None | datetime.date = None,
+        end_date: None | datetime.date = None,
+    ) -> T:
+        if start_date is not None and end_date is not None and end_date < start_date:
+            raise ValueError(
+                f"start_date({start_date!s}) must be the same or before end_date({end_date!s})"
+            )
+
+        key = make_key(name, params, start_date=start_date, end_date=end_date)
+        entry = self._get_memory(key)
+        if entry is None:
+            entry = self._get_disk(key)
+            if entry is not None:
+                self._put_memory(key, entry)
+
+        if entry is None:
+            seq, value = compute_at_watermark(self.models, compute)
+            entry = _Entry(
+                seq=seq, start_date=start_date, end_date=end_date, value=value
+            )
+            self._put_memory(key, entry)
+            self._put_disk(key, entry)
+
+        return ty.cast(T, entry.value)
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self.disk_path is not None:
+            for disk_file in self.disk_path.glob("*.pkl"):
+                disk_file.unlink(missing_ok=True)
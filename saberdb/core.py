@@ -15,6 +15,11 @@ from pybaseball import statcast, playerid_reverse_lookup  # type: ignore
 
 from . import util as U
 from . import model
+from . import heatmap
+from . import arsenal
+from . import sidecar
+from . import search
+from . import schema
 
 
 SORT_COLUMNS = ["game_pk", "at_bat_number", "pitch_number"]
@@ -56,8 +61,17 @@ def coerce(field: pw.Field, value: ty.Any) -> tuple[ty.Any, type]:
 
             return new_value, int
         case pw.DoubleField():
+            if isinstance(value, int):
+                new_value = float(value)
+
             return new_value, float
-        case pw.CharField() | pw.TextField():
+        case pw.TextField():
+            # NOTE: Added text columns may see numbers in later batches.
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                new_value = str(value)
+
+            return new_value, str
+        case pw.CharField():
             return new_value, str
         case pw.DateField():
             if isinstance(value, float):
@@ -172,151 +186,233 @@ def fill_player_table(
 
 
 # TODO(mkcmkc): Separate into individual fill functions to aggregate SQL queries.
-# TODO(mkcmkc): Do in a DB transaction.
 # TODO(mkcmkc): Do bulk actions to minimize SQL calls.
-def fill_db(db: pw.SqliteDatabase, models: model.DBModels, df: pd.DataFrame) -> None:
+def fill_db(
+    db: pw.SqliteDatabase,
+    models: model.DBModels,
+    df: pd.DataFrame,
+    *,
+    sidecar_path: None | Path = None,
+    arsenal_index_path: None | Path = None,
+) -> None:
     if db.is_closed():
         raise ValueError("db must be connected")
 
-    db.create_tables([models.Game, models.Pitch, models.Player, models.DateCache])
+    db.create_tables(
+        [
+            models.Game,
+            models.Pitch,
+            models.Player,
+            models.DateCache,
+            models.Heatmap,
+            models.IngestWatermark,
+            models.Arsenal,
+            models.SchemaVersion,
+            models.DateSchema,
+        ]
+    )
+    search.create_description_index(db)
     cached_dates: set[str] = set()
     for record in models.DateCache.select():
         cached_date = record.date
         assert isinstance(cached_date, datetime.date)
         cached_dates.add(cached_date.strftime("%Y-%m-%d"))
 
+    # NOTE: Added columns commit on their own before the batch. The model
+    # learns about them immediately, so a batch rollback must not undo them.
     df_new = df[~(df["game_date"].isin(cached_dates))]
-    player_lookup = fill_player_table(df_new, models)
+    df_new = schema.conform_frame(
+        db,
+        models,
+        df_new,
+        required_columns=GAME_COLUMNS,
+        ignored_columns=DROP_COLUMNS,
+    )
 
-    pitch_fields: list[pw.Field] = list(models.Pitch._meta.fields.values())  # type: ignore
+    # NOTE: Pitches, DateCache, ingest watermarks and every derived table
+    # commit together, so a failure part way through never leaves dates
+    # cached without their watermark or derived rows.
+    with db.atomic():
+        player_lookup = fill_player_table(df_new, models)
 
-    game_groups = df_new.groupby(["game_pk"], sort=False, as_index=False)
-    player_id_fields = (
-        {"batter_id", "pitcher_id"}
-        | {f"on_{i!s}b_id" for i in range(1, 4)}
-        | {f"fielder_{i!s}_id" for i in range(2, 10)}
-    )
-    for _, df_group in game_groups:
-        first_row = df_group.iloc[0]
-        pk = first_row["game_pk"]
-        assert isinstance(pk, np.int64)  # type: ignore
-        pk = int(pk)
-        date_str = first_row["game_date"]
-        assert isinstance(date_str, str)
-        date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-        game_type = first_row["game_type"]
-        assert isinstance(game_type, str)
-        assert game_type in model.GameType, U.dbg_info(
-            "Game type is invalid", game_type=game_type
-        )
-        home_team = first_row["home_team"]
-        assert isinstance(home_team, str)
-        away_team = first_row["away_team"]
-        assert isinstance(away_team, str)
+        pitch_fields: list[pw.Field] = list(models.Pitch._meta.fields.values())  # type: ignore
 
-        date_cache = models.DateCache(date=date)
-        try:
-            models.DateCache.get_by_id(date_cache.get_id())
-            raise ValueError(
-                "Date of game is already in DateCache: "
-                + json.dumps(dict(df_group=df_group))
-            )
-        except pw.DoesNotExist:
-            date_cache.save(force_insert=True)
-
-        game = models.Game(
-            pk=pk,
-            date=date_cache,
-            game_type=game_type,
-            home_team=home_team,
-            away_team=away_team,
+        game_groups = df_new.groupby(["game_pk"], sort=False, as_index=False)
+        player_id_fields = (
+            {"batter_id", "pitcher_id"}
+            | {f"on_{i!s}b_id" for i in range(1, 4)}
+            | {f"fielder_{i!s}_id" for i in range(2, 10)}
         )
-
-        try:
-            models.Game.get_by_id(game.get_id())
-            raise ValueError(
-                "Inserting duplicate rows into Game table: " + json.dumps(dict(pk=pk))
+        ingested_dates: set[datetime.date] = set()
+        reingested_dates: set[datetime.date] = set()
+        for _, df_group in game_groups:
+            first_row = df_group.iloc[0]
+            pk = first_row["game_pk"]
+            assert isinstance(pk, np.int64)  # type: ignore
+            pk = int(pk)
+            date_str = first_row["game_date"]
+            assert isinstance(date_str, str)
+            date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
+            game_type = first_row["game_type"]
+            assert isinstance(game_type, str)
+            assert game_type in model.GameType, U.dbg_info(
+                "Game type is invalid", game_type=game_type
+            )
+            home_team = first_row["home_team"]
+            assert isinstance(home_team, str)
+            away_team = first_row["away_team"]
+            assert isinstance(away_team, str)
+
+            date_cache = models.DateCache(date=date)
+            try:
+                models.DateCache.get_by_id(date_cache.get_id())
+                raise ValueError(
+                    "Date of game is already in DateCache: "
+                    + json.dumps(dict(df_group=df_group))
+                )
+            except pw.DoesNotExist:
+                date_cache.save(force_insert=True)
+                IngestWatermark = models.IngestWatermark
+                previous = IngestWatermark.select().where(IngestWatermark.date == date)
+                if previous.exists():
+                    reingested_dates.add(date)
+
+                IngestWatermark.create(date=date)
+                ingested_dates.add(date)
+
+            game = models.Game(
+                pk=pk,
+                date=date_cache,
+                game_type=game_type,
+                home_team=home_team,
+                away_team=away_team,
             )
-        except pw.DoesNotExist:
-            game.save(force_insert=True)
-
-        for _, row in df_group.iterrows():
-            pitch_args: dict[str, ty.Any] = {}
-            for field in pitch_fields:
-                is_nullable = field.null
-                column_name = field.column_name
-                if column_name == "id":
-                    continue
 
-                assert not isinstance(field, pw.AutoField)
+            try:
+                models.Game.get_by_id(game.get_id())
+                raise ValueError(
+                    "Inserting duplicate rows into Game table: "
+                    + json.dumps(dict(pk=pk))
+                )
+            except pw.DoesNotExist:
+                game.save(force_insert=True)
+
+            for _, row in df_group.iterrows():
+                pitch_args: dict[str, ty.Any] = {}
+                for field in pitch_fields:
+                    is_nullable = field.null
+                    column_name = field.column_name
+                    if column_name == "id":
+                        continue
+
+                    assert not isinstance(field, pw.AutoField)
+
+                    if column_name == "game_id":
+                        pitch_args[column_name] = game
+                        continue
+
+                    if column_name in player_id_fields:
+                        if column_name in {"on_1b_id", "on_2b_id", "on_3b_id"}:
+                            assert is_nullable
+                        else:
+                            assert not is_nullable
+
+                        index = column_name[:-(len("_id"))]
+                        player_id = row[index]
+                        assert isinstance(player_id, int) or isinstance(
+                            player_id, float
+                        )
+                        player_id = None if is_null(player_id) else player_id
+                        if player_id is None:
+                            player = None
+                        else:
+                            if isinstance(player_id, float):
+                                assert player_id == int(player_id)  # type: ignore
+                                player_id = int(player_id)
+
+                            assert isinstance(player_id, int)
+                            player = player_lookup[player_id]
+
+                        assert is_nullable or player is not None, U.dbg_info(
+                            "Cannot use `None` in non-nullable field",
+                            row=row,
+                            field=field,
+                        )
+                        pitch_args[column_name] = player
+                        continue
+
+                    assert not isinstance(field, pw.ForeignKeyField)
+
+                    index = {
+                        "result": "type",
+                    }.get(column_name, column_name)
+                    assert isinstance(index, str)
+
+                    if index == "half_inning":
+                        inning = row["inning"]
+                        assert isinstance(inning, int)
+                        inning_topbot = row["inning_topbot"].lower()
+                        assert inning_topbot in {"top", "bot"}
+                        value: ty.Any = 2 * inning - 1
+                        if inning_topbot == "bot":
+                            value += 1
+                    else:
+                        value = row[index]
 
-                if column_name == "game_id":
-                    pitch_args[column_name] = game
-                    continue
+                    value = None if is_null(value) else value
+                    assert is_nullable or value is not None, U.dbg_info(
+                        "Cannot use `None` in non-nullable field", row=row, field=field
+                    )
+                    value, expected_type = coerce(field, value)
+                    assert value is None or isinstance(value, expected_type), (
+                        U.dbg_info(
+                            "Invalid value/type",
+                            row=row,
+                            field=field,
+                            value=value,
+                            value_type=type(value),
+                            expected_type=expected_type,
+                        )
+                    )
+                    pitch_args[column_name] = value
+
+                pitch = models.Pitch(**pitch_args)
+                pitch.save(force_insert=True)
+
+        # NOTE: Heatmaps and arsenals only add up pitches, so the seasons of
+        # dates that were deleted and ingested again are rebuilt from `pitch`.
+        rebuilt_seasons = {x.year for x in reingested_dates}
+        is_rebuilt = df_new["game_date"].str[:4].astype(int).isin(rebuilt_seasons)
+        heatmap.fill_heatmap_table(db, models, df_new[~is_rebuilt])
+        arsenal.fill_arsenal_table(db, models, df_new[~is_rebuilt])
+        if len(rebuilt_seasons) > 0:
+            heatmap.rebuild_heatmaps(db, models, rebuilt_seasons)
+            arsenal.rebuild_arsenals(db, models, rebuilt_seasons)
+
+        search.fill_description_index(db, ingested_dates)
+        schema.record_date_schemas(
+            models,
+            ingested_dates,
+            df.attrs.get(schema.SOURCE_COLUMNS_ATTR, {}),
+        )
 
-                if column_name in player_id_fields:
-                    if column_name in {"on_1b_id", "on_2b_id", "on_3b_id"}:
-                        assert is_nullable
-                    else:
-                        assert not is_nullable
-
-                    index = column_name[:-(len("_id"))]
-                    player_id = row[index]
-                    assert isinstance(player_id, int) or isinstance(player_id, float)
-                    player_id = None if is_null(player_id) else player_id
-                    if player_id is None:
-                        player = None
-                    else:
-                        if isinstance(player_id, float):
-                            assert player_id == int(player_id)  # type: ignore
-                            player_id = int(player_id)
+    if sidecar_path is not None:
+        sidecar.update_sidecar(db, models, sidecar_path)
 
-                        assert isinstance(player_id, int)
-                        player = player_lookup[player_id]
+    if arsenal_index_path is not None:
+        arsenal.update_index(models, arsenal_index_path)
 
-                    assert is_nullable or player is not None, U.dbg_info(
-                        "Cannot use `None` in non-nullable field",
-                        row=row,
-                        field=field,
-                    )
-                    pitch_args[column_name] = player
-                    continue
-
-                assert not isinstance(field, pw.ForeignKeyField)
-
-                index = {
-                    "result": "type",
-                }.get(column_name, column_name)
-                assert isinstance(index, str)
-
-                if index == "half_inning":
-                    inning = row["inning"]
-                    assert isinstance(inning, int)
-                    inning_topbot = row["inning_topbot"].lower()
-                    assert inning_topbot in {"top", "bot"}
-                    value: ty.Any = 2 * inning - 1
-                    if inning_topbot == "bot":
-                        value += 1
-                else:
-                    value = row[index]
-
-                value = None if is_null(value) else value
-                assert is_nullable or value is not None, U.dbg_info(
-                    "Cannot use `None` in non-nullable field", row=row, field=field
-                )
-                value, expected_type = coerce(field, value)
-                assert value is None or isinstance(value, expected_type), U.dbg_info(
-                    "Invalid value/type",
-                    row=row,
-                    field=field,
-                    value=value,
-                    value_type=type(value),
-                    expected_type=expected_type,
-                )
-                pitch_args[column_name] = value
 
-            pitch = models.Pitch(**pitch_args)
-            pitch.save(force_insert=True)
+def finalize_statcast_batch(
+    df: pd.DataFrame, source_columns: dict[str, list[str]]
+) -> pd.DataFrame:
+    df = (
+        df.drop(DROP_COLUMNS, axis=1, errors="ignore")
+        .sort_values(by=SORT_COLUMNS)
+        .reset_index(drop=True)
+    )
+    df.attrs[schema.SOURCE_COLUMNS_ATTR] = source_columns
+    return df
 
 
 def download_statcast_day(date: datetime.date) -> pd.DataFrame:
@@ -346,6 +442,7 @@ def download_statcast(
         cached_dates.add(cached_date)
 
     df: pd.DataFrame | None = None
+    source_columns: dict[str, list[str]] = {}
     current_date = start_date
     current_batch_size = 0
     while current_date <= end_date:
@@ -362,12 +459,19 @@ def download_statcast(
             current_date += datetime.timedelta(days=1)
             continue
 
+        source_columns[str(current_date)] = list(day_df.columns)
         if df is None:
             df = day_df
         else:
-            assert list(df.columns) == list(day_df.columns), U.dbg_info(
-                "Column mismatch", df=list(df.columns), day_df=list(day_df.columns)
-            )
+            added_columns = [x for x in day_df.columns if x not in df.columns]
+            removed_columns = [x for x in df.columns if x not in day_df.columns]
+            if len(added_columns) > 0 or len(removed_columns) > 0:
+                cprint(
+                    f"Columns changed on {current_date!s}: "
+                    f"added={added_columns!s} removed={removed_columns!s}",
+                    "yellow",
+                )
+
             df = pd.concat([df, day_df], ignore_index=True)
 
         current_date += datetime.timedelta(days=1)
@@ -375,30 +479,36 @@ def download_statcast(
         if current_batch_size == batch_size.days:
             current_batch_size = 0
             assert isinstance(df, pd.DataFrame)
-            yield (
-                df.drop(DROP_COLUMNS, axis=1)
-                .sort_values(by=SORT_COLUMNS)
-                .reset_index(drop=True)
-            )
+            yield finalize_statcast_batch(df, source_columns)
             df = None
+            source_columns = {}
 
     if df is not None:
         assert isinstance(df, pd.DataFrame)
-        yield (
-            df.drop(DROP_COLUMNS, axis=1)
-            .sort_values(by=SORT_COLUMNS)
-            .reset_index(drop=True)
-        )
+        yield finalize_statcast_batch(df, source_columns)
 
 
-def download_into_db(db_path: Path, start_date: datetime.date, end_date: datetime.date):
+def download_into_db(
+    db_path: Path,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    *,
+    sidecar_path: None | Path = None,
+    arsenal_index_path: None | Path = None,
+):
     db: None | pw.SqliteDatabase = None
     try:
         db = pw.SqliteDatabase(str(db_path))
         models = model.get_db_models(db)
         db.connect()
         for df in download_statcast(models, start_date, end_date):
-            fill_db(db, models, df)
+            fill_db(
+                db,
+                models,
+                df,
+                sidecar_path=sidecar_path,
+                arsenal_index_path=arsenal_index_path,
+            )
     finally:
         if db is not None and not db.is_closed():
             db.close()
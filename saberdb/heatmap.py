@@ -0,0 +1,214 @@
+from collections.abc import Iterable
+import typing as ty
+
+import pandas as pd
+import peewee as pw
+import numpy as np
+
+from . import util as U
+from . import model
+from . import schema
+
+
+# NOTE: Edges are in feet from the center of the plate (`plate_x`) and from the
+# ground (`plate_z`). Changing them invalidates every stored grid.
+X_EDGES = np.linspace(-2.5, 2.5, 26)
+Z_EDGES = np.linspace(-0.5, 5.5, 31)
+GRID_SHAPE = (len(X_EDGES) - 1, len(Z_EDGES) - 1)
+GRID_DTYPE = np.dtype("<u4")
+
+KEY_COLUMNS = ["season", "pitch_type", "stand", "p_throws", "balls", "strikes"]
+SOURCE_COLUMNS = [
+    *(role.value for role in model.PlayerRole),
+    "game_date",
+    "pitch_type",
+    "stand",
+    "p_throws",
+    "balls",
+    "strikes",
+    "plate_x",
+    "plate_z",
+]
+
+
+class HeatmapKey(ty.NamedTuple):
+    player_id: int
+    role: model.PlayerRole
+    season: int
+    pitch_type: None | str
+    stand: str
+    p_throws: str
+    balls: int
+    strikes: int
+
+
+def bin_locations(plate_x: ty.Any, plate_z: ty.Any) -> np.ndarray:
+    # NOTE: Out of range pitches are clipped into the outermost bins so that
+    # grid totals always match pitch counts.
+    xs = np.clip(np.asarray(plate_x, dtype=np.float64), X_EDGES[0], X_EDGES[-1])
+    zs = np.clip(np.asarray(plate_z, dtype=np.float64), Z_EDGES[0], Z_EDGES[-1])
+    grid, _, _ = np.histogram2d(xs, zs, bins=(X_EDGES, Z_EDGES))
+    return grid.astype(GRID_DTYPE)
+
+
+def encode_grid(grid: np.ndarray) -> bytes:
+    assert grid.shape == GRID_SHAPE, U.dbg_info(
+        "Invalid grid shape", shape=list(grid.shape)
+    )
+    return grid.astype(GRID_DTYPE, copy=False).tobytes()
+
+
+def decode_grid(blob: bytes) -> np.ndarray:
+    grid = np.frombuffer(blob, dtype=GRID_DTYPE)
+    assert grid.size == GRID_SHAPE[0] * GRID_SHAPE[1], U.dbg_info(
+        "Invalid grid size", size=grid.size
+    )
+    return grid.reshape(GRID_SHAPE)
+
+
+def _key_of(record: model._Heatmap) -> HeatmapKey:
+    return HeatmapKey(
+        player_id=int(record.player_id),  # type: ignore
+        role=model.PlayerRole(record.role),
+        season=int(record.season),  # type: ignore
+        pitch_type=record.pitch_type,  # type: ignore
+        stand=record.stand,  # type: ignore
+        p_throws=record.p_throws,  # type: ignore
+        balls=int(record.balls),  # type: ignore
+        strikes=int(record.strikes),  # type: ignore
+    )
+
+
+# NOTE: Grids are only ever added to, so they assume the pitches of a date
+# are filled once. `fill_db` rebuilds the seasons of re-ingested dates, and
+# deleting a date without re-ingesting it needs `rebuild_heatmaps`.
+def fill_heatmap_table(
+    db: pw.SqliteDatabase, models: model.DBModels, df: pd.DataFrame
+) -> None:
+    df = df[df["plate_x"].notna() & df["plate_z"].notna()]
+    if df.shape[0] == 0:
+        return
+
+    df = df.assign(season=df["game_date"].str[:4].astype(int))
+    seasons = sorted(set(map(int, df["season"])))
+    with db.atomic():
+        for role in model.PlayerRole:
+            player_ids = sorted(set(map(int, df[role.value])))
+            existing: dict[HeatmapKey, model._Heatmap] = {}
+            query = models.Heatmap.select().where(
+                (models.Heatmap.role == role.value)
+                & (models.Heatmap.season.in_(seasons))
+                & (models.Heatmap.player.in_(player_ids))
+            )
+            for record in query:
+                existing[_key_of(record)] = record
+
+            groups = df.groupby([role.value, *KEY_COLUMNS], sort=False, dropna=False)
+            for group_key, df_group in groups:
+                player_id, season, pitch_type, stand, p_throws, balls, strikes = (
+                    ty.cast(tuple[ty.Any, ...], group_key)
+                )
+                key = HeatmapKey(
+                    player_id=int(player_id),
+                    role=role,
+                    season=int(season),
+                    pitch_type=None if pd.isna(pitch_type) else str(pitch_type),
+                    stand=str(stand),
+                    p_throws=str(p_throws),
+                    balls=int(balls),
+                    strikes=int(strikes),
+                )
+                grid = bin_locations(df_group["plate_x"], df_group["plate_z"])
+                existing_record = existing.get(key)
+                if existing_record is None:
+                    models.Heatmap.create(
+                        player=key.player_id,
+                        role=key.role.value,
+                        season=key.season,
+                        pitch_type=key.pitch_type,
+                        stand=key.stand,
+                        p_throws=key.p_throws,
+                        balls=key.balls,
+                        strikes=key.strikes,
+                        grid=encode_grid(grid),
+                    )
+                else:
+                    existing_record.grid = encode_grid(  # type: ignore
+                        decode_grid(existing_record.grid) + grid  # type: ignore
+                    )
+                    existing_record.save()
+
+
+def rebuild_heatmaps(
+    db: pw.SqliteDatabase,
+    models: model.DBModels,
+    seasons: None | Iterable[int] = None,
+) -> None:
+    Heatmap = models.Heatmap
+    with db.atomic():
+        query = Heatmap.delete()
+        if seasons is not None:
+            seasons = sorted(set(seasons))
+            query = query.where(Heatmap.season.in_(seasons))
+
+        query.execute()
+        df = schema.read_pitch_frame(db, models, SOURCE_COLUMNS, seasons=seasons)
+        fill_heatmap_table(db, models, df)
+
+
+def get_heatmaps(
+    models: model.DBModels,
+    player_id: int,
+    role: model.PlayerRole,
+    *,
+    seasons: None | Iterable[int] = None,
+    pitch_types: None | Iterable[None | str] = None,
+    stands: None | Iterable[str] = None,
+    p_throws: None | Iterable[str] = None,
+    balls: None | Iterable[int] = None,
+    strikes: None | Iterable[int] = None,
+) -> dict[HeatmapKey, np.ndarray]:
+    Heatmap = models.Heatmap
+    condition = (Heatmap.player == player_id) & (Heatmap.role == role.value)
+    if seasons is not None:
+        condition &= Heatmap.season.in_(list(seasons))
+
+    if pitch_types is not None:
+        pitch_types = list(pitch_types)
+        pitch_type_condition = Heatmap.pitch_type.in_(
+            [x for x in pitch_types if x is not None]
+        )
+        if None in pitch_types:
+            pitch_type_condition |= Heatmap.pitch_type.is_null()
+
+        condition &= pitch_type_condition
+
+    if stands is not None:
+        condition &= Heatmap.stand.in_(list(stands))
+
+    if p_throws is not None:
+        condition &= Heatmap.p_throws.in_(list(p_throws))
+
+    if balls is not None:
+        condition &= Heatmap.balls.in_(list(balls))
+
+    if strikes is not None:
+        condition &= Heatmap.strikes.in_(list(strikes))
+
+    return {
+        _key_of(record): decode_grid(record.grid)  # type: ignore
+        for record in Heatmap.select().where(condition)
+    }
+
+
+def get_heatmap(
+    models: model.DBModels,
+    player_id: int,
+    role: model.PlayerRole,
+    **filters: ty.Any,
+) -> np.ndarray:
+    total = np.zeros(GRID_SHAPE, dtype=np.uint64)
+    for grid in get_heatmaps(models, player_id, role, **filters).values():
+        total += grid
+
+    return total
@@ -1,3 +1,7 @@
 from .core import get_db_models as get_db_models, DBModels as DBModels
 from .player import _Player as _Player
 from .game import GameType as GameType
+from .heatmap import PlayerRole as PlayerRole
+from .heatmap import _Heatmap as _Heatmap
+from .arsenal import _Arsenal as _Arsenal
+from .schema import _SchemaVersion as _SchemaVersion
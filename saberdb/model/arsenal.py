@@ -0,0 +1,24 @@
+import typing as ty
+
+import peewee as pw
+
+from .player import _Player
+
+
+class _Arsenal(pw.Model):
+    pitcher = pw.ForeignKeyField(_Player, backref="arsenals")
+    season = pw.BigIntegerField(index=True)
+    stats = pw.BlobField()
+
+    class Meta:
+        table_name = "arsenal"
+        indexes = ((("pitcher", "season"), True),)
+
+
+def arsenal_model(db: pw.SqliteDatabase) -> ty.Type[_Arsenal]:
+    class Arsenal(_Arsenal):
+        class Meta:  # type: ignore
+            table_name = "arsenal"
+            database = db
+
+    return Arsenal
@@ -2,9 +2,22 @@ import dataclasses
 
 import peewee as pw
 
-from .date_cache import _DateCache, date_cache_model
+from .arsenal import _Arsenal, arsenal_model
+from .date_cache import (
+    _DateCache,
+    _IngestWatermark,
+    date_cache_model,
+    ingest_watermark_model,
+)
 from .game import _Game, game_model
+from .heatmap import _Heatmap, heatmap_model
 from .player import _Player, player_model
+from .schema import (
+    _DateSchema,
+    _SchemaVersion,
+    date_schema_model,
+    schema_version_model,
+)
 from .pitch import _Pitch, pitch_model
 
 
@@ -14,6 +27,11 @@ class DBModels:
     Game: type[_Game]
     Player: type[_Player]
     Pitch: type[_Pitch]
+    Heatmap: type[_Heatmap]
+    IngestWatermark: type[_IngestWatermark]
+    Arsenal: type[_Arsenal]
+    SchemaVersion: type[_SchemaVersion]
+    DateSchema: type[_DateSchema]
 
 
 def get_db_models(db: pw.SqliteDatabase) -> DBModels:
@@ -22,4 +40,9 @@ def get_db_models(db: pw.SqliteDatabase) -> DBModels:
         Game=game_model(db),
         Player=player_model(db),
         Pitch=pitch_model(db),
+        Heatmap=heatmap_model(db),
+        IngestWatermark=ingest_watermark_model(db),
+        Arsenal=arsenal_model(db),
+        SchemaVersion=schema_version_model(db),
+        DateSchema=date_schema_model(db),
     )
@@ -10,6 +10,17 @@ class _DateCache(pw.Model):
         table_name = "date_cache"
 
 
+# NOTE: Append-only log with one row per date touched by an ingest. The max
+# `id` is the ingest watermark; rows past a given `id` are the dates changed
+# since then.
+class _IngestWatermark(pw.Model):
+    id = pw.AutoField()
+    date = pw.DateField(index=True)
+
+    class Meta:
+        table_name = "ingest_watermark"
+
+
 def date_cache_model(db: pw.SqliteDatabase) -> ty.Type[_DateCache]:
     class DateCache(_DateCache):
         class Meta:  # type: ignore
@@ -17,3 +28,12 @@ def date_cache_model(db: pw.SqliteDatabase) -> ty.Type[_DateCache]:
             database = db
 
     return DateCache
+
+
+def ingest_watermark_model(db: pw.SqliteDatabase) -> ty.Type[_IngestWatermark]:
+    class IngestWatermark(_IngestWatermark):
+        class Meta:  # type: ignore
+            table_name = "ingest_watermark"
+            database = db
+
+    return IngestWatermark
@@ -0,0 +1,38 @@
+import enum
+import typing as ty
+
+import peewee as pw
+
+from . import util
+from .player import _Player
+from .pitch import Handedness, PitchType
+
+
+class PlayerRole(enum.StrEnum):
+    BATTER = "batter"
+    PITCHER = "pitcher"
+
+
+class _Heatmap(pw.Model):
+    player = pw.ForeignKeyField(_Player, backref="heatmaps")
+    role = util.enum_to_field(PlayerRole)
+    season = pw.BigIntegerField()
+    pitch_type = util.enum_to_field(PitchType, null=True)
+    stand = util.enum_to_field(Handedness)
+    p_throws = util.enum_to_field(Handedness)
+    balls = pw.BigIntegerField()
+    strikes = pw.BigIntegerField()
+    grid = pw.BlobField()
+
+    class Meta:
+        table_name = "heatmap"
+        indexes = ((("player", "role", "season"), False),)
+
+
+def heatmap_model(db: pw.SqliteDatabase) -> ty.Type[_Heatmap]:
+    class Heatmap(_Heatmap):
+        class Meta:  # type: ignore
+            table_name = "heatmap"
+            database = db
+
+    return Heatmap
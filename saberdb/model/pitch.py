@@ -203,6 +203,7 @@ class _Pitch(pw.Model):
 
     class Meta:
         table_name = "pitch"
+        indexes = ((("game", "at_bat_number"), False),)
 
 
 def pitch_model(db: pw.SqliteDatabase) -> ty.Type[_Pitch]:
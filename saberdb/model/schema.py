@@ -0,0 +1,40 @@
+import typing as ty
+
+import peewee as pw
+
+from .date_cache import _DateCache
+
+
+class _SchemaVersion(pw.Model):
+    id = pw.AutoField()
+    # NOTE: JSON list of the raw Statcast column names, in source order.
+    columns = pw.TextField(unique=True)
+
+    class Meta:
+        table_name = "schema_version"
+
+
+class _DateSchema(pw.Model):
+    date = pw.ForeignKeyField(_DateCache, primary_key=True, backref="schema")
+    version = pw.ForeignKeyField(_SchemaVersion, backref="dates", index=True)
+
+    class Meta:
+        table_name = "date_schema"
+
+
+def schema_version_model(db: pw.SqliteDatabase) -> ty.Type[_SchemaVersion]:
+    class SchemaVersion(_SchemaVersion):
+        class Meta:  # type: ignore
+            table_name = "schema_version"
+            database = db
+
+    return SchemaVersion
+
+
+def date_schema_model(db: pw.SqliteDatabase) -> ty.Type[_DateSchema]:
+    class DateSchema(_DateSchema):
+        class Meta:  # type: ignore
+            table_name = "date_schema"
+            database = db
+
+    return DateSchema
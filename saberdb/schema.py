@@ -0,0 +1,277 @@
+from collections.abc import Iterable
+import datetime
+import json
+import re
+import typing as ty
+
+from termcolor import cprint
+import numpy as np
+import pandas as pd
+import peewee as pw
+
+from . import model
+
+
+# NOTE: `download_statcast` stores the raw column names of every downloaded
+# day in `DataFrame.attrs` under this key, as `{"YYYY-MM-DD": [column, ...]}`.
+SOURCE_COLUMNS_ATTR = "source_columns"
+
+_COLUMN_NAME_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+_SQL_TYPES: dict[type[pw.Field], str] = {
+    pw.BigIntegerField: "INTEGER",
+    pw.DoubleField: "REAL",
+    pw.TextField: "TEXT",
+}
+
+
+def source_columns(field: pw.Field) -> list[str]:
+    column_name = field.column_name
+    assert isinstance(column_name, str)
+    match column_name:
+        case "id":
+            return []
+        case "game_id":
+            return ["game_pk"]
+        case "half_inning":
+            return ["inning", "inning_topbot"]
+        case "result":
+            return ["type"]
+
+    if isinstance(field, pw.ForeignKeyField):
+        return [column_name.removesuffix("_id")]
+
+    return [column_name]
+
+
+def field_for(series: pd.Series) -> None | pw.Field:
+    # NOTE: The type is inferred from the non-null values only, since an all
+    # null column has no type yet. Callers defer such columns to a later batch.
+    # Whole numbers in one batch do not make a column integral, so numbers are
+    # stored as REAL.
+    values = series.dropna()
+    if len(values) == 0:
+        return None
+
+    match pd.api.types.infer_dtype(values, skipna=True):
+        case "boolean":
+            return pw.BigIntegerField(null=True)
+        case "integer" | "floating" | "mixed-integer-float" | "decimal":
+            return pw.DoubleField(null=True)
+        case _:
+            return pw.TextField(null=True)
+
+
+def _field_from_sql_type(data_type: str) -> pw.Field:
+    for field_type, sql_type in _SQL_TYPES.items():
+        if data_type.upper() == sql_type:
+            return field_type(null=True)
+
+    raise ValueError(f"Cannot map SQL type {data_type!s} to a field")
+
+
+def sync_pitch_fields(db: pw.SqliteDatabase, models: model.DBModels) -> None:
+    column_names = {
+        field.column_name
+        for field in models.Pitch._meta.fields.values()  # type: ignore
+    }
+    for column in db.get_columns(models.Pitch._meta.table_name):  # type: ignore
+        if column.name not in column_names:
+            field = _field_from_sql_type(column.data_type)
+            models.Pitch._meta.add_field(column.name, field)  # type: ignore
+
+
+def _alter_pitch_table(
+    db: pw.SqliteDatabase, models: model.DBModels, name: str, field: pw.Field
+) -> None:
+    if _COLUMN_NAME_RE.match(name) is None:
+        raise ValueError(f"Invalid source column name: {name!r}")
+
+    if not field.null:
+        raise ValueError(f"Added column {name} must be nullable")
+
+    # NOTE: A nullable column without a default is a metadata only change in
+    # SQLite, so existing rows are not rewritten.
+    table_name = models.Pitch._meta.table_name  # type: ignore
+    db.execute_sql(
+        f'ALTER TABLE "{table_name}" ADD COLUMN "{name}" {_SQL_TYPES[type(field)]}'
+    )
+
+
+def add_pitch_columns(
+    db: pw.SqliteDatabase, models: model.DBModels, fields: dict[str, pw.Field]
+) -> None:
+    # NOTE: The model only learns about the columns once they are committed,
+    # so a rolled back `ALTER TABLE` never leaves a field without a column.
+    with db.atomic():
+        for name, field in fields.items():
+            _alter_pitch_table(db, models, name, field)
+
+    for name, field in fields.items():
+        models.Pitch._meta.add_field(name, field)  # type: ignore
+
+
+def add_pitch_column(
+    db: pw.SqliteDatabase, models: model.DBModels, name: str, field: pw.Field
+) -> None:
+    add_pitch_columns(db, models, {name: field})
+
+
+def conform_frame(
+    db: pw.SqliteDatabase,
+    models: model.DBModels,
+    df: pd.DataFrame,
+    *,
+    required_columns: Iterable[str],
+    ignored_columns: Iterable[str],
+) -> pd.DataFrame:
+    sync_pitch_fields(db, models)
+    required_columns = list(required_columns)
+    for column in required_columns:
+        if column not in df.columns:
+            raise ValueError(f"Source is missing required column {column}")
+
+    fields: list[pw.Field] = list(models.Pitch._meta.fields.values())  # type: ignore
+    known_columns = (
+        set(required_columns)
+        | set(ignored_columns)
+        | {column for field in fields for column in source_columns(field)}
+    )
+
+    added_fields: dict[str, pw.Field] = {}
+    invalid_columns: list[str] = []
+    deferred_columns: list[str] = []
+    for column in df.columns:
+        if column in known_columns:
+            continue
+
+        if not isinstance(column, str) or _COLUMN_NAME_RE.match(column) is None:
+            invalid_columns.append(str(column))
+            continue
+
+        field = field_for(df[column])
+        if field is None:
+            deferred_columns.append(column)
+            continue
+
+        added_fields[column] = field
+
+    if len(invalid_columns) > 0:
+        cprint(f"Skipping invalid source columns: {', '.join(invalid_columns)}", "red")
+
+    if len(deferred_columns) > 0:
+        cprint(f"Deferring all null columns: {', '.join(deferred_columns)}", "yellow")
+
+    if len(added_fields) > 0:
+        cprint(f"Adding pitch columns: {', '.join(added_fields)}", "yellow")
+        add_pitch_columns(db, models, added_fields)
+
+    missing_columns: dict[str, ty.Any] = {}
+    for field in fields:
+        for column in source_columns(field):
+            if column in df.columns:
+                continue
+
+            if not field.null:
+                raise ValueError(
+                    f"Source is missing column {column} required by a non-nullable"
+                    f" pitch field: {field.column_name!s}"
+                )
+
+            missing_columns[column] = np.nan
+
+    if len(missing_columns) > 0:
+        cprint(f"Missing source columns: {', '.join(missing_columns)}", "yellow")
+        df = df.assign(**missing_columns)
+
+    return df
+
+
+def read_pitch_frame(
+    db: pw.SqliteDatabase,
+    models: model.DBModels,
+    columns: Iterable[str],
+    *,
+    seasons: None | Iterable[int] = None,
+) -> pd.DataFrame:
+    # NOTE: Reads stored pitches back under their source column names, so
+    # derived tables can be rebuilt with the same code that fills them.
+    pitch_columns: dict[str, str] = {}
+    for field in models.Pitch._meta.fields.values():  # type: ignore
+        field_sources = source_columns(field)
+        if len(field_sources) == 1:
+            pitch_columns[field_sources[0]] = field.column_name
+
+    columns = list(columns)
+    selects: list[str] = []
+    for column in columns:
+        if column == "game_date":
+            selects.append('game."date_id"')
+        elif column in pitch_columns:
+            selects.append(f'pitch."{pitch_columns[column]}"')
+        else:
+            raise ValueError(f"Cannot read source column {column} from pitch")
+
+    where = ""
+    params: list[str] = []
+    if seasons is not None:
+        seasons = sorted(set(seasons))
+        if len(seasons) == 0:
+            return pd.DataFrame(columns=columns)
+
+        where = "WHERE " + " OR ".join(
+            '(game."date_id" >= ? AND game."date_id" <= ?)' for _ in seasons
+        )
+        for season in seasons:
+            params.extend([f"{season:04d}-01-01", f"{season:04d}-12-31"])
+
+    cursor = db.execute_sql(
+        f"""
+        SELECT {", ".join(selects)}
+        FROM "pitch" AS pitch
+        JOIN "game" AS game ON game."pk" = pitch."game_id"
+        {where}
+        ORDER BY pitch."id"
+        """,
+        params,
+    )
+    return pd.DataFrame(cursor.fetchall(), columns=columns)
+
+
+def record_date_schemas(
+    models: model.DBModels,
+    dates: Iterable[datetime.date],
+    columns_by_date: dict[str, list[str]],
+) -> None:
+    # NOTE: Dates without recorded source columns (e.g. frames not built by
+    # `download_statcast`) get no schema, and a re-ingest drops the stale one.
+    DateSchema = models.DateSchema
+    versions: dict[str, model._SchemaVersion] = {}
+    unknown_dates: list[datetime.date] = []
+    for date in sorted(dates):
+        date_columns = columns_by_date.get(str(date))
+        if date_columns is None:
+            unknown_dates.append(date)
+            continue
+
+        columns = json.dumps(date_columns)
+        version = versions.get(columns)
+        if version is None:
+            version, _ = models.SchemaVersion.get_or_create(columns=columns)
+            versions[columns] = version
+
+        DateSchema.replace(date=date, version=version).execute()
+
+    if len(unknown_dates) > 0:
+        DateSchema.delete().where(DateSchema.date.in_(unknown_dates)).execute()
+
+
+def get_date_schema(models: model.DBModels, date: datetime.date) -> None | list[str]:
+    try:
+        record = models.DateSchema.get_by_id(date)
+    except pw.DoesNotExist:
+        return None
+
+    version = models.SchemaVersion.get_by_id(record.version_id)  # type: ignore
+    columns = json.loads(version.columns)  # type: ignore
+    assert isinstance(columns, list)
+    return columns
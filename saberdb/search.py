@@ -0,0 +1,195 @@
+from collections.abc import Iterable
+import dataclasses
+import datetime
+
+import peewee as pw
+
+from . import model
+
+
+TABLE_NAME = "pa_description"
+DEFAULT_LIMIT = 100
+
+# NOTE: Every pitch of a plate appearance repeats the same `des`, so the index
+# holds one row per (game, at bat) keyed by this rowid instead of one per
+# pitch. Keeping the key computable in SQL lets the delete trigger remove rows
+# by rowid rather than scanning the index.
+AT_BAT_KEY_MULTIPLIER = 1000
+_ROWID_SQL = f"{{table}}.game_id * {AT_BAT_KEY_MULTIPLIER!s} + {{table}}.at_bat_number"
+
+_CREATE_TABLE_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS "{TABLE_NAME}" USING fts5(
+    des,
+    game_id UNINDEXED,
+    at_bat_number UNINDEXED,
+    tokenize = 'porter unicode61'
+)
+"""
+
+_CREATE_TRIGGER_SQL = f"""
+CREATE TRIGGER IF NOT EXISTS "pitch_{TABLE_NAME}_delete" AFTER DELETE ON "pitch"
+WHEN NOT EXISTS (
+    SELECT 1 FROM "pitch"
+    WHERE "game_id" = old."game_id" AND "at_bat_number" = old."at_bat_number"
+)
+BEGIN
+    DELETE FROM "{TABLE_NAME}" WHERE rowid = {_ROWID_SQL.format(table="old")};
+END
+"""
+
+# NOTE: The bare `des` column is taken from the row holding the max
+# `pitch_number`, i.e. the final pitch of the plate appearance.
+_POPULATE_SQL = f"""
+INSERT OR REPLACE INTO "{TABLE_NAME}" (rowid, des, game_id, at_bat_number)
+SELECT {_ROWID_SQL.format(table="pitch")}, pitch.des, pitch.game_id,
+    pitch.at_bat_number
+FROM (
+    SELECT "game_id", "at_bat_number", "des", MAX("pitch_number")
+    FROM "pitch"
+    {{where}}
+    GROUP BY "game_id", "at_bat_number"
+) AS pitch
+"""
+
+
+def create_description_index(db: pw.SqliteDatabase) -> None:
+    is_new = TABLE_NAME not in db.get_tables()
+    with db.atomic():
+        db.execute_sql(_CREATE_TABLE_SQL)
+        db.execute_sql(_CREATE_TRIGGER_SQL)
+        if is_new:
+            db.execute_sql(_POPULATE_SQL.format(where=""))
+
+
+def fill_description_index(
+    db: pw.SqliteDatabase, dates: Iterable[datetime.date]
+) -> None:
+    date_strs = sorted({str(date) for date in dates})
+    if len(date_strs) == 0:
+        return
+
+    placeholders = ", ".join("?" for _ in date_strs)
+    where = (
+        'WHERE "game_id" IN '
+        f'(SELECT "pk" FROM "game" WHERE "date_id" IN ({placeholders}))'
+    )
+    db.execute_sql(_POPULATE_SQL.format(where=where), date_strs)
+
+
+def rebuild_description_index(db: pw.SqliteDatabase) -> None:
+    with db.atomic():
+        db.execute_sql(f'DELETE FROM "{TABLE_NAME}"')
+        db.execute_sql(_POPULATE_SQL.format(where=""))
+
+
+def quote_query(text: str) -> str:
+    # NOTE: Each whitespace separated term becomes an FTS5 string so that
+    # punctuation and quotes in natural text ("out, shortstop", "O'Neil") are
+    # tokenized instead of parsed as query syntax. Terms are implicitly ANDed.
+    return " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+
+
+@dataclasses.dataclass(frozen=True)
+class DescriptionMatch:
+    game_pk: int
+    date: datetime.date
+    game_type: model.GameType
+    at_bat_number: int
+    des: str
+    pitch_ids: list[int]
+    rank: float
+
+
+def search_descriptions(
+    db: pw.SqliteDatabase,
+    query: str,
+    *,
+    limit: int = DEFAULT_LIMIT,
+    start_date: None | datetime.date = None,
+    end_date: None | datetime.date = None,
+    game_types: None | Iterable[model.GameType] = None,
+    raw: bool = False,
+) -> list[DescriptionMatch]:
+    if db.is_closed():
+        raise ValueError("db must be connected")
+
+    if limit <= 0:
+        raise ValueError(f"limit({limit!s}) must be positive")
+
+    match_query = query if raw else quote_query(query)
+    if len(match_query.strip()) == 0:
+        raise ValueError("query must not be empty")
+
+    conditions = [f'"{TABLE_NAME}" MATCH ?']
+    params: list[object] = [match_query]
+    if start_date is not None:
+        conditions.append('game."date_id" >= ?')
+        params.append(str(start_date))
+
+    if end_date is not None:
+        conditions.append('game."date_id" <= ?')
+        params.append(str(end_date))
+
+    if game_types is not None:
+        game_type_values = [model.GameType(x).value for x in game_types]
+        if len(game_type_values) == 0:
+            return []
+
+        placeholders = ", ".join("?" for _ in game_type_values)
+        conditions.append(f'game."game_type" IN ({placeholders})')
+        params.extend(game_type_values)
+
+    try:
+        cursor = db.execute_sql(
+            f"""
+            SELECT fts.game_id, fts.at_bat_number, fts.des, game."date_id",
+                game."game_type", fts.rank
+            FROM "{TABLE_NAME}" AS fts
+            JOIN "game" AS game ON game."pk" = fts.game_id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY fts.rank
+            LIMIT ?
+            """,
+            [*params, limit],
+        )
+        rows = cursor.fetchall()
+    except pw.OperationalError as e:
+        if "fts5" not in str(e):
+            raise
+
+        raise ValueError(f"Invalid full-text query {query!r}: {e!s}") from e
+
+    if len(rows) == 0:
+        return []
+
+    # NOTE: Only the matched plate appearances are looked up. Joining against
+    # a VALUES list lets SQLite search the `pitch(game_id, at_bat_number)`
+    # index per pair, where a row value `IN` scans the whole index.
+    at_bats = sorted({(int(row[0]), int(row[1])) for row in rows})
+    placeholders = ", ".join("(?, ?)" for _ in at_bats)
+    pitch_ids: dict[tuple[int, int], list[int]] = {key: [] for key in at_bats}
+    pitch_cursor = db.execute_sql(
+        f"""
+        SELECT pitch."id", pitch."game_id", pitch."at_bat_number"
+        FROM (VALUES {placeholders}) AS at_bat
+        JOIN "pitch" AS pitch ON pitch."game_id" = at_bat.column1
+            AND pitch."at_bat_number" = at_bat.column2
+        ORDER BY pitch."game_id", pitch."at_bat_number", pitch."pitch_number"
+        """,
+        [x for at_bat in at_bats for x in at_bat],
+    )
+    for pitch_id, game_id, at_bat_number in pitch_cursor:
+        pitch_ids[(int(game_id), int(at_bat_number))].append(int(pitch_id))
+
+    return [
+        DescriptionMatch(
+            game_pk=int(game_id),
+            date=datetime.date.fromisoformat(date_str),
+            game_type=model.GameType(game_type),
+            at_bat_number=int(at_bat_number),
+            des=des,
+            pitch_ids=pitch_ids[(int(game_id), int(at_bat_number))],
+            rank=float(rank),
+        )
+        for game_id, at_bat_number, des, date_str, game_type, rank in rows
+    ]
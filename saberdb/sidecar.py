@@ -0,0 +1,373 @@
+from collections.abc import Iterator
+import contextlib
+import dataclasses
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+import typing as ty
+
+import numpy as np
+import peewee as pw
+
+from . import util as U
+from . import model
+from . import cache
+
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 3
+FETCH_SIZE = 65536
+
+INT_DTYPE = np.dtype("<i8")
+FLOAT_DTYPE = np.dtype("<f8")
+CODE_DTYPE = np.dtype("<i2")
+MASK_DTYPE = np.dtype("|b1")
+
+
+def default_path(db_path: Path) -> Path:
+    return db_path.with_name(db_path.name + ".columns")
+
+
+def date_cache_version(models: model.DBModels) -> str:
+    digest = hashlib.sha256()
+    for record in models.DateCache.select().order_by(models.DateCache.date):
+        cached_date = record.date
+        assert isinstance(cached_date, datetime.date)
+        digest.update(str(cached_date).encode())
+        digest.update(b"\n")
+
+    return digest.hexdigest()
+
+
+@dataclasses.dataclass(frozen=True)
+class ColumnSpec:
+    name: str
+    dtype: str
+    nullable: bool
+    categories: None | list[str]
+
+
+def column_specs(models: model.DBModels) -> list[ColumnSpec]:
+    specs: list[ColumnSpec] = []
+    for field in models.Pitch._meta.fields.values():  # type: ignore
+        column_name = field.column_name
+        assert isinstance(column_name, str)
+        categories: None | list[str] = None
+        dtype: np.dtype
+        match field:
+            case pw.TextField():
+                # NOTE: Free text has no fixed width representation.
+                continue
+            case pw.CharField() if field.choices is not None:
+                dtype = CODE_DTYPE
+                categories = [value for value, _ in field.choices]
+                assert len(categories) <= np.iinfo(CODE_DTYPE).max, U.dbg_info(
+                    "Too many categories", field=column_name
+                )
+            case pw.AutoField() | pw.BigIntegerField() | pw.ForeignKeyField():
+                dtype = INT_DTYPE
+            case pw.DoubleField():
+                dtype = FLOAT_DTYPE
+            case _:
+                assert False, U.dbg_info("Cannot handle field type", field=column_name)
+
+        specs.append(
+            ColumnSpec(
+                name=column_name,
+                dtype=dtype.str,
+                nullable=bool(field.null),
+                categories=categories,
+            )
+        )
+
+    return specs
+
+
+def _data_path(path: Path, spec: ColumnSpec) -> Path:
+    return path / f"{spec.name}.bin"
+
+
+def _mask_path(path: Path, spec: ColumnSpec) -> Path:
+    return path / f"{spec.name}.mask"
+
+
+def _read_manifest(path: Path) -> None | dict[str, ty.Any]:
+    manifest_path = path / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    assert isinstance(manifest, dict)
+    return manifest
+
+
+def _write_manifest(path: Path, manifest: dict[str, ty.Any]) -> None:
+    tmp_path = path / (MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+
+    os.replace(tmp_path, path / MANIFEST_NAME)
+
+
+def _fetch_chunks(
+    db: pw.SqliteDatabase, specs: list[ColumnSpec], after_id: int
+) -> Iterator[list[tuple[ty.Any, ...]]]:
+    columns = ", ".join(f'"{spec.name}"' for spec in specs)
+    cursor = db.execute_sql(
+        f'SELECT {columns} FROM "pitch" WHERE "id" > ? ORDER BY "id"', (after_id,)
+    )
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if len(rows) == 0:
+            break
+
+        yield rows
+
+
+def _encode_categories(categories: list[str], values: tuple[ty.Any, ...]) -> np.ndarray:
+    # NOTE: Statcast uses values the enums do not list (e.g. forkball "FO")
+    # and `fill_db` stores them as is. The rows are already committed here, so
+    # unseen values are appended to the categories instead of failing. Codes
+    # of existing values never change, so appends stay valid.
+    lookup = {x: i for i, x in enumerate(categories)}
+    codes = np.zeros(len(values), dtype=CODE_DTYPE)
+    for i, x in enumerate(values):
+        if x is None:
+            continue
+
+        code = lookup.get(x)
+        if code is None:
+            code = len(categories)
+            if code > np.iinfo(CODE_DTYPE).max:
+                raise ValueError(f"Too many categories for a sidecar column: {x!r}")
+
+            categories.append(x)
+            lookup[x] = code
+
+        codes[i] = code
+
+    return codes
+
+
+def _encode_column(
+    spec: ColumnSpec, values: tuple[ty.Any, ...]
+) -> tuple[np.ndarray, None | np.ndarray]:
+    mask = np.fromiter((x is None for x in values), dtype=MASK_DTYPE, count=len(values))
+    assert spec.nullable or not mask.any(), U.dbg_info(
+        "Cannot use `None` in non-nullable column", column=spec.name
+    )
+    if spec.categories is not None:
+        data = _encode_categories(spec.categories, values)
+    else:
+        data = np.fromiter(
+            (0 if x is None else x for x in values),
+            dtype=np.dtype(spec.dtype),
+            count=len(values),
+        )
+
+    return data, (mask if spec.nullable else None)
+
+
+def _append_rows(
+    db: pw.SqliteDatabase,
+    path: Path,
+    specs: list[ColumnSpec],
+    row_count: int,
+    after_id: int,
+) -> tuple[int, int]:
+    # NOTE: Truncate to the committed row count first so that a previously
+    # interrupted append never leaves garbage between old and new rows.
+    with contextlib.ExitStack() as stack:
+        files: dict[Path, ty.BinaryIO] = {}
+        for spec in specs:
+            paths = [(_data_path(path, spec), np.dtype(spec.dtype).itemsize)]
+            if spec.nullable:
+                paths.append((_mask_path(path, spec), MASK_DTYPE.itemsize))
+
+            for file_path, itemsize in paths:
+                f = stack.enter_context(
+                    open(file_path, "r+b" if file_path.exists() else "w+b")
+                )
+                files[file_path] = f
+                f.truncate(row_count * itemsize)
+                f.seek(0, os.SEEK_END)
+
+        id_index = [spec.name for spec in specs].index("id")
+        for rows in _fetch_chunks(db, specs, after_id):
+            columns = list(zip(*rows))
+            for spec, values in zip(specs, columns):
+                data, mask = _encode_column(spec, values)
+                files[_data_path(path, spec)].write(data.tobytes())
+                if mask is not None:
+                    files[_mask_path(path, spec)].write(mask.tobytes())
+
+            row_count += len(rows)
+            after_id = int(columns[id_index][-1])
+
+    return row_count, after_id
+
+
+def _extends(stored_specs: list[ColumnSpec], specs: list[ColumnSpec]) -> bool:
+    if len(stored_specs) != len(specs):
+        return False
+
+    for stored_spec, spec in zip(stored_specs, specs):
+        if (stored_spec.name, stored_spec.dtype, stored_spec.nullable) != (
+            spec.name,
+            spec.dtype,
+            spec.nullable,
+        ):
+            return False
+
+        if spec.categories is None:
+            if stored_spec.categories is not None:
+                return False
+        elif (
+            stored_spec.categories is None
+            or stored_spec.categories[: len(spec.categories)] != spec.categories
+        ):
+            return False
+
+    return True
+
+
+def _can_append(models: model.DBModels, manifest: dict[str, ty.Any]) -> bool:
+    # NOTE: `pitch.id` is not AUTOINCREMENT, so SQLite reuses the ids of
+    # deleted tail rows. Appending past `last_pitch_id` is only safe when no
+    # date the sidecar covers was ingested again since its watermark and the
+    # covered rows are exactly the ones already written.
+    IngestWatermark = models.IngestWatermark
+    Pitch = models.Pitch
+    Game = models.Game
+    seq = manifest["seq"]
+    if seq > cache.get_watermark(models).seq:
+        return False
+
+    covered_dates = IngestWatermark.select(IngestWatermark.date).where(
+        IngestWatermark.id <= seq
+    )
+    retouched = (
+        IngestWatermark.select()
+        .where((IngestWatermark.id > seq) & (IngestWatermark.date.in_(covered_dates)))
+        .exists()
+    )
+    if retouched:
+        return False
+
+    row_count = manifest["row_count"]
+    below_last = Pitch.select().where(Pitch.id <= manifest["last_pitch_id"]).count()  # type: ignore
+    if below_last != row_count:
+        return False
+
+    covered_rows = (
+        Pitch.select()
+        .join(Game, on=(Pitch.game == Game.pk))  # type: ignore
+        .where(Game.date.in_(covered_dates))
+        .count()
+    )
+    return covered_rows == row_count
+
+
+def update_sidecar(db: pw.SqliteDatabase, models: model.DBModels, path: Path) -> None:
+    if db.is_closed():
+        raise ValueError("db must be connected")
+
+    specs = column_specs(models)
+    manifest = _read_manifest(path)
+    row_count = 0
+    last_pitch_id = 0
+    if manifest is not None and manifest["format"] == FORMAT_VERSION:
+        # NOTE: Stored specs carry the categories seen so far, which extend
+        # the enum choices of the model.
+        stored_specs = [ColumnSpec(**spec) for spec in manifest["columns"]]
+        if _extends(stored_specs, specs) and _can_append(models, manifest):
+            specs = stored_specs
+            row_count = manifest["row_count"]
+            last_pitch_id = manifest["last_pitch_id"]
+
+    path.mkdir(parents=True, exist_ok=True)
+    if row_count == 0 and manifest is not None:
+        # NOTE: Rebuilds unlink instead of truncating so that readers which
+        # still map the old files keep a consistent view.
+        for spec in specs:
+            _data_path(path, spec).unlink(missing_ok=True)
+            _mask_path(path, spec).unlink(missing_ok=True)
+
+    seq, (row_count, last_pitch_id) = cache.compute_at_watermark(
+        models, lambda: _append_rows(db, path, specs, row_count, last_pitch_id)
+    )
+    _write_manifest(
+        path,
+        {
+            "format": FORMAT_VERSION,
+            "seq": seq,
+            "version": date_cache_version(models),
+            "row_count": row_count,
+            "last_pitch_id": last_pitch_id,
+            "columns": [dataclasses.asdict(spec) for spec in specs],
+        },
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class Sidecar:
+    path: Path
+    seq: int
+    version: str
+    row_count: int
+    specs: dict[str, ColumnSpec]
+
+    def is_current(self, models: model.DBModels) -> bool:
+        if self.seq != cache.get_watermark(models).seq:
+            return False
+
+        return self.version == date_cache_version(models)
+
+    def _map(self, file_path: Path, dtype: np.dtype) -> np.ndarray:
+        if self.row_count == 0:
+            return np.empty(0, dtype=dtype)
+
+        return np.memmap(file_path, dtype=dtype, mode="r", shape=(self.row_count,))
+
+    def column(self, name: str) -> np.ndarray:
+        spec = self.specs[name]
+        return self._map(_data_path(self.path, spec), np.dtype(spec.dtype))
+
+    def mask(self, name: str) -> np.ndarray:
+        spec = self.specs[name]
+        if not spec.nullable:
+            return np.zeros(self.row_count, dtype=MASK_DTYPE)
+
+        return self._map(_mask_path(self.path, spec), MASK_DTYPE)
+
+    def masked(self, name: str) -> np.ma.MaskedArray:
+        return np.ma.MaskedArray(self.column(name), mask=self.mask(name))
+
+    def categories(self, name: str) -> list[str]:
+        categories = self.specs[name].categories
+        if categories is None:
+            raise ValueError(f"Column {name} is not an enum column")
+
+        return categories
+
+
+def open_sidecar(path: Path) -> Sidecar:
+    manifest = _read_manifest(path)
+    if manifest is None:
+        raise FileNotFoundError(f"No sidecar manifest in {path!s}")
+
+    if manifest["format"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported sidecar format: {manifest['format']!s}")
+
+    specs = [ColumnSpec(**spec) for spec in manifest["columns"]]
+    return Sidecar(
+        path=path,
+        seq=manifest["seq"],
+        version=manifest["version"],
+        row_count=manifest["row_count"],
+        specs={spec.name: spec for spec in specs},
+    )